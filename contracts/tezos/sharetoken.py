@@ -1,18 +1,15 @@
 import smartpy as sp
 
+RegisterShareType = sp.TRecord(account = sp.TAddress, amount = sp.TNat).layout(("account", "amount"))
+
 class ShareToken(sp.Contract):
     def __init__(self, _deployer, _metadata,):
         self.init(
             deployer = _deployer,
             parent = _deployer,
             metadata = _metadata,
-            balances = sp.big_map(
-                tkey = sp.TAddress,
-                tvalue = sp.TRecord(
-                    balance = sp.TNat,
-                    approvals = sp.TMap(k = sp.TAddress, v = sp.TNat)
-                )
-            ),
+            balances = sp.big_map(tkey = sp.TAddress, tvalue = sp.TNat),
+            approvals = sp.big_map(tkey = sp.TPair(sp.TAddress, sp.TAddress), tvalue = sp.TNat),
             total_supply = sp.nat(1000000)
         )
 
@@ -37,80 +34,66 @@ class ShareToken(sp.Contract):
             sp.TRecord(source = sp.TAddress, destination = sp.TAddress, amount = sp.TNat)
                 .layout(("source", ("destination", "amount"))))
 
-        sp.verify(self.data.balances.contains(params.source), message = "No balance")
+        source = sp.local('source', self.data.balances.get(params.source, message = "No balance"))
+
         sp.verify(params.source != params.destination, message = "Invalid destination")
-        sp.verify(self.data.balances[params.source].balance >= params.amount, message = "Insufficient balance")
+        sp.verify(params.amount > sp.nat(0), message = "Invalid amount")
+
+        destination = sp.local('destination', self.data.balances.get(params.destination, default_value = sp.nat(0)))
+
+        sp.verify(source.value >= params.amount, message = "Insufficient balance")
         sp.if (sp.sender != params.source):
-            sp.verify(self.data.balances[params.source].approvals[sp.sender] >= params.amount, message = "Insufficient allowance")
-        sp.else:
-            pass
+            allowance = sp.local('allowance', self.data.approvals.get((params.source, sp.sender), default_value = sp.nat(0)))
+            sp.verify(allowance.value >= params.amount, message = "Insufficient allowance")
+            allowance.value = sp.as_nat(allowance.value - params.amount)
 
-        sp.if ~ self.data.balances.contains(params.destination):
-            self.data.balances[params.destination] = sp.record(balance = params.amount, approvals = {})
-        sp.else:
-            self.data.balances[params.destination].balance += params.amount
+            sp.if (allowance.value == sp.nat(0)):
+                del self.data.approvals[(params.source, sp.sender)]
+            sp.else:
+                self.data.approvals[(params.source, sp.sender)] = allowance.value
 
-        self.data.balances[params.source].balance = sp.as_nat(self.data.balances[params.source].balance - params.amount)
+        source.value = sp.as_nat(source.value - params.amount)
+        destination.value += params.amount
 
-        sp.if (sp.sender != params.source):
-            self.data.balances[params.source].approvals[params.destination] = sp.as_nat(self.data.balances[params.source].approvals[params.destination] - params.amount)
+        sp.if (source.value == sp.nat(0)):
+            del self.data.balances[params.source]
         sp.else:
-            pass
+            self.data.balances[params.source] = source.value
+        self.data.balances[params.destination] = destination.value
 
-        RegisterShareReference = sp.contract(RegisterShareType, self.data.parent, entry_point="registerShare").open_some()
-        setShare = sp.record(account = params.destination, amount = self.data.balances[params.destination].balance)
-        setShare = sp.set_type_expr(setShare, RegisterShareType)
-        sp.transfer(setShare, sp.tez(0), RegisterShareReference)
+        RegisterShareReference = sp.local('RegisterShareReference', sp.contract(RegisterShareType, self.data.parent, entry_point="registerShare").open_some())
 
-        RegisterShareReference = sp.contract(RegisterShareType, self.data.parent, entry_point="registerShare").open_some()
-        setShare = sp.record(account = params.source, amount = self.data.balances[params.source].balance)
-        setShare = sp.set_type_expr(setShare, RegisterShareType)
-        sp.transfer(setShare, sp.tez(0), RegisterShareReference)
+        setShare = sp.record(account = params.destination, amount = destination.value)
+        sp.transfer(setShare, sp.tez(0), RegisterShareReference.value)
 
-        # TODO: clean up approvals map
-        # TODO: clean up balances map
+        setShare = sp.record(account = params.source, amount = source.value)
+        sp.transfer(setShare, sp.tez(0), RegisterShareReference.value)
 
     @sp.entry_point
     def approve(self, spender, amount):
         sp.set_type(spender, sp.TAddress)
         sp.set_type(amount, sp.TNat)
 
-        sp.verify(self.data.balances.contains(sp.sender), message = "No balance")
         sp.verify(sp.sender != spender, message = "Invalid spender")
-        sp.verify((self.data.balances[sp.sender].approvals.get(spender, default_value = sp.nat(0)) == 0) | (amount == 0), "Unsafe allowance change")
 
         sp.if (amount > 0):
-            self.data.balances[sp.sender].approvals[spender] = amount
+            sp.verify(self.data.balances.contains(sp.sender), message = "No balance")
+            sp.verify(self.data.approvals.get((sp.sender, spender), default_value = sp.nat(0)) == 0, "Unsafe allowance change")
+            self.data.approvals[(sp.sender, spender)] = amount
         sp.else:
-            del self.data.balances[sp.sender].approvals[spender]
+            del self.data.approvals[(sp.sender, spender)]
 
     @sp.onchain_view(pure=True)
     def getAllowance(self, params):
-        sp.set_type(params.owner, sp.TAddress)
-        sp.set_type(params.spender, sp.TAddress)
+        sp.set_type(params, sp.TRecord(owner = sp.TAddress, spender = sp.TAddress).layout(("owner", "spender")))
 
-        amount = sp.local('amount', sp.nat(0))
-        sp.if ~self.data.balances.contains(params.owner):
-            amount.value = sp.nat(0)
-        sp.else:
-            sp.if ~self.data.balances[params.owner].approvals.contains(params.spender):
-                amount.value = sp.nat(0)
-            sp.else:
-                amount.value = self.data.balances[params.owner].approvals[params.spender]
-
-        sp.result(amount.value)
+        sp.result(self.data.approvals.get((params.owner, params.spender), default_value = sp.nat(0)))
 
     @sp.onchain_view(pure=True)
     def getBalance(self, owner):
         sp.set_type(owner, sp.TAddress)
 
-        amount = sp.local('amount', sp.nat(0))
-        sp.if (self.data.balances.contains(owner)):
-            amount.value = self.data.balances[owner].balance
-        sp.else:
-            amount.value = sp.nat(0)
-
-        sp.result(amount.value)
+        sp.result(self.data.balances.get(owner, default_value = sp.nat(0)))
 
     @sp.onchain_view(pure=True)
     def getTotalSupply(self):
@@ -123,12 +106,6 @@ class ShareToken(sp.Contract):
         sp.verify(sp.sender == self.data.parent, message = "Privileged operation")
 
         sp.if (params.amount > sp.nat(0)):
-            sp.if ~self.data.balances.contains(params.account):
-                self.data.balances[params.account] = sp.record(balance = params.amount, approvals = {})
-            sp.else:
-                self.data.balances[params.account].balance = params.amount
+            self.data.balances[params.account] = params.amount
         sp.else:
-            sp.if self.data.balances.contains(params.account):
-                del self.data.balances[params.account]
-            sp.else:
-                pass
+            del self.data.balances[params.account]